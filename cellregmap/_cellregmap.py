@@ -1,3 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+from threading import Lock, local
 from typing import Optional
 
 from glimix_core.lmm import LMM
@@ -5,19 +9,32 @@ from numpy import (
     asarray,
     atleast_1d,
     atleast_2d,
+    clip,
     concatenate,
+    einsum,
+    empty,
+    empty_like,
+    float32,
+    float64,
+    full,
     inf,
+    isnan,
     linspace,
+    logical_not,
+    minimum,
+    multiply,
+    nansum,
+    newaxis,
     ones,
     sqrt,
     stack,
 )
-from numpy.linalg import cholesky
-from numpy_sugar import ddot
-from numpy_sugar.linalg import economic_qs_linear, economic_svd
+from numpy_sugar import epsilon
+from numpy_sugar.linalg import economic_svd
+from scipy.special import chdtrc
 from tqdm import tqdm
 
-from ._math import PMat, QSCov, ScoreStatistic
+from ._math import BlockQS, PMat, QSCov, ScoreStatistic, gram_qs
 
 
 class CellRegMap:
@@ -77,6 +94,10 @@ class CellRegMap:
 
 
         self._Ls = list(asarray(L, float) for L in Ls)
+        if len(self._Ls) > 0:
+            self._cat_Ls = concatenate(self._Ls, axis=1)
+        else:
+            self._cat_Ls = empty((self._y.shape[0], 0))
 
         assert self._W.ndim == 2
         assert self._E0.ndim == 2
@@ -90,152 +111,180 @@ class CellRegMap:
             assert self._y.shape[0] == L.shape[0]
             assert L.ndim == 2
 
-        self._null_lmm_assoc = {}
-
-        self._halfSigma = {}
         self._Sigma_qs = {}
-        # TODO: remove it after debugging
-        self._Sigma = {}
+        self._null = {}
         
         # option to set different background (when Ls are defined, background is K*EEt + EEt)
-        if len(Ls) == 0:
-            # self._rho0 = [1.0]
-            if hK is None:   # EEt only as background
-                self._rho1 = [1.0]
-                self._halfSigma[1.0] = self._E1
-                self._Sigma_qs[1.0] = economic_qs_linear(self._E1, return_q1=False)
-            else:            # hK is decomposition of K, background in this case is K + EEt
-                self._rho1 = linspace(0, 1, 11)
-                for rho1 in self._rho1:
-                    a = sqrt(rho1)
-                    b = sqrt(1 - rho1)
-                    hS = concatenate([a * self._E1] + [b * hK], axis=1)
-                    self._halfSigma[rho1] = hS
-                    self._Sigma_qs[rho1] = economic_qs_linear(
-                        self._halfSigma[rho1], return_q1=False
-                    )
+        if len(Ls) == 0 and hK is None:   # EEt only as background
+            self._rho1 = [1.0]
+            self._Sigma_bqs = None
+            return
+
+        if len(Ls) == 0:   # hK is decomposition of K, background in this case is K + EEt
+            hB = asarray(hK, float)
         else:
-            # self._rho0 = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
-            self._rho1 = linspace(0, 1, 11)
-            for rho1 in self._rho1:
-                # Σ = ρ₁𝙴𝙴ᵀ + (1-ρ₁)𝙺⊙E
-                # concatenate((sqrt(rho1) * self._E, sqrt(1 - rho1) * G1), axis=1)
-                # self._Sigma[rho1] = rho1 * self._EE + (1 - rho1) * self._K
-                # self._Sigma_qs[rho1] = economic_qs(self._Sigma[rho1])
-                a = sqrt(rho1)
-                b = sqrt(1 - rho1)
-                hS = concatenate([a * self._E1] + [b * L for L in Ls], axis=1)
-                self._halfSigma[rho1] = hS
-                self._Sigma_qs[rho1] = economic_qs_linear(
-                    self._halfSigma[rho1], return_q1=False
-                )
+            hB = self._cat_Ls
+
+        self._rho1 = linspace(0, 1, 11)
+        # 𝙴₁ and 𝙻 (or hK) are decomposed once; each ρ₁ then only needs a small
+        # eigen decomposition, computed the first time a fit asks for it
+        self._Sigma_bqs = BlockQS(self._E1, hB)
 
     @property
     def n_samples(self):
         return self._y.shape[0]
 
-    def predict_interaction(self, G, MAF):
+    def _background_qs(self, rho1):
+        """
+        Economic eigen decomposition of Σ[ρ₁] = ρ₁𝙴₁𝙴₁ᵀ + (1-ρ₁)𝙺⊙E, cached per ρ₁.
+        """
+        if rho1 not in self._Sigma_qs:
+            if self._Sigma_bqs is None:
+                self._Sigma_qs[rho1] = gram_qs(self._E1)
+            else:
+                self._Sigma_qs[rho1] = self._Sigma_bqs(sqrt(rho1), sqrt(1 - rho1))
+        return self._Sigma_qs[rho1]
+
+    def _fit_best_rho1(self, M, restricted, Sigma_qs=None, executor=None):
+        """
+        Fit 𝐲 ~ 𝓝(𝙼𝛃, 𝓋₁Σ[ρ₁] + 𝓋₂𝙸) over the ρ₁ grid and keep the best fit.
+
+        `Sigma_qs` maps ρ₁ to the decomposition of Σ[ρ₁] and defaults to the one of
+        the null background. The fits are independent: they run in `executor` when
+        one is given (see `_thread_pool`), sequentially otherwise. Ties are resolved
+        in favour of the smallest ρ₁.
+        """
+        if Sigma_qs is None:
+            Sigma_qs = self._background_qs
+
+        def fit(rho1):
+            QS = Sigma_qs(rho1)
+            lmm = LMM(self._y, M, QS, restricted=restricted)
+            lmm.fit(verbose=False)
+            return lmm.lml(), rho1, lmm, QS
+
+        if executor is None:
+            fits = [fit(rho1) for rho1 in self._rho1]
+        else:
+            fits = list(executor.map(fit, self._rho1))
+
+        best = {"lml": -inf, "rho1": 0}
+        for lml, rho1, lmm, QS in fits:
+            if lml > best["lml"]:
+                best["lml"] = lml
+                best["rho1"] = rho1
+                best["lmm"] = lmm
+                best["QS"] = QS
+        return best
+
+    def _null_model(self, restricted, executor=None):
+        """
+        Best fit of 𝐲 ~ 𝓝(W𝛂, 𝓋₁Σ[ρ₁] + 𝓋₂𝙸), with its covariance as `QSCov` and K₀⁻¹W.
+
+        It only depends on 𝐲, W and Σ, so it is computed once and reused by every
+        scan (e.g., across permutations).
+        """
+        if restricted not in self._null:
+            best = self._fit_best_rho1(self._W, restricted, executor=executor)
+            lmm = best["lmm"]
+            (Q0,), S0 = best["QS"]
+            qscov = QSCov(Q0, S0, lmm.v0, lmm.v1)
+            self._null[restricted] = best, qscov, qscov.solve(self._W)
+        return self._null[restricted]
+
+    def predict_interaction(self, G, MAF, n_jobs: int = 1):
         """
         Estimate effect sizes for a given set of SNPs
+
+        With `n_jobs` > 1, the ρ₁ grid of each SNP is fitted by that many threads.
         """
         # breakpoint()
-        G = asarray(G, float)
+        G = _asarray_genotype(G)
         E0 = self._E0
         W = self._W
-        n_snps = G.shape[1]
         beta_g_s = []
         beta_gxe_s = []
 
         p = asarray(atleast_1d(MAF), float)
         normalization = 1 / sqrt(2 * p * (1 - p))
 
-        for i in range(n_snps):
-            g = G[:, [i]]
-            # mean(𝐲) = W𝛂 + 𝐠𝛽₁ + 𝙴𝝲 = 𝙼𝛃
-            M = concatenate((W, g, E0), axis=1)
-            gE = g * E0
-            best = {"lml": -inf, "rho1": 0}
-            hSigma_p = {}
-            Sigma_qs = {}
-            for rho1 in self._rho1:
+        # The 𝙻 block of ½Σ[ρ₁] is SNP-independent: it is factorised once and each
+        # SNP only refactorises its 𝐠⊙𝙴 block.
+        Sigma_qs = None
+
+        # mean(𝐲) = W𝛂 + 𝐠𝛽₁ + 𝙴𝝲 = 𝙼𝛃, where only the 𝐠 column of 𝙼 changes per SNP
+        kW = W.shape[1]
+        M = empty((self.n_samples, kW + 1 + E0.shape[1]))
+        M[:, :kW] = W
+        M[:, kW + 1 :] = E0
+        gE = empty_like(E0)
+
+        # One pool serves every SNP
+        with _thread_pool(n_jobs) as executor:
+            for i, g in _iter_snps(G):
+                M[:, kW : kW + 1] = g
+                multiply(g, E0, out=gE)
+                if Sigma_qs is None:
+                    Sigma_qs = BlockQS(gE, self._cat_Ls)
+                else:
+                    Sigma_qs.set_A(gE)
                 # Σ[ρ₁] = ρ₁(𝐠⊙𝙴)(𝐠⊙𝙴)ᵀ + (1-ρ₁)𝙺⊙EEᵀ
-                a = sqrt(rho1)
-                b = sqrt(1 - rho1)
-                hSigma_p[rho1] = concatenate(
-                    [a * gE] + [b * L for L in self._Ls], axis=1
-                )
-                # (
-                #     (a * gE, b * self._G), axis=1
-                # )
                 # cov(𝐲) = 𝓋₁Σ[ρ₁] + 𝓋₂𝙸
-                # lmm = Kron2Sum(Y, [[1]], M, hSigma_p[rho1], restricted=True)
-                Sigma_qs[rho1] = economic_qs_linear(
-                    hSigma_p[rho1], return_q1=False
+                best = self._fit_best_rho1(
+                    M,
+                    True,
+                    lambda rho1: Sigma_qs(sqrt(rho1), sqrt(1 - rho1)),
+                    executor,
                 )
-                lmm = LMM(self._y, M, Sigma_qs[rho1], restricted=True)
-                lmm.fit(verbose=False)
-
-                if lmm.lml() > best["lml"]:
-                    best["lml"] = lmm.lml()
-                    best["rho1"] = rho1
-                    best["lmm"] = lmm
-
-            # breakpoint()
-            lmm = best["lmm"]
-            # beta_g = 𝛽₁
-            beta_g = lmm.beta[W.shape[1]]
-            # yadj = 𝐲 - 𝙼𝛃
-            yadj = (self._y - lmm.mean()).reshape(self._y.shape[0], 1)
-            rho1 = best["rho1"]
-            v1 = lmm.v0
-            v2 = lmm.v1
-            hSigma_p_qs = economic_qs_linear(hSigma_p[rho1], return_q1=False)
-            qscov = QSCov(hSigma_p_qs[0][0], hSigma_p_qs[1], v1, v2)
-            # v = cov(𝐲)⁻¹(𝐲 - 𝙼𝛃)
-            v = qscov.solve(yadj)
-
-            sigma2_gxe = v1 * rho1
-            beta_gxe = sigma2_gxe * E0 @ (gE.T @ v) * normalization[i]
-            # beta_star = (beta_g * normalization + beta_gxe)
-
-            beta_g_s.append(beta_g)
-            beta_gxe_s.append(beta_gxe)
 
+                # breakpoint()
+                lmm = best["lmm"]
+                beta = lmm.beta
+                # beta_g = 𝛽₁
+                beta_g = beta[kW]
+                # yadj = 𝐲 - 𝙼𝛃, with 𝙼 still holding this SNP
+                yadj = (self._y - M @ beta).reshape(self._y.shape[0], 1)
+                rho1 = best["rho1"]
+                v1 = lmm.v0
+                v2 = lmm.v1
+                hSigma_p_qs = best["QS"]
+                qscov = QSCov(hSigma_p_qs[0][0], hSigma_p_qs[1], v1, v2)
+                # v = cov(𝐲)⁻¹(𝐲 - 𝙼𝛃)
+                v = qscov.solve(yadj)
+
+                sigma2_gxe = v1 * rho1
+                # Scale the k-vector (𝐠⊙𝙴₀)ᵀ𝐯 rather than the n-vector of effects
+                beta_gxe = E0 @ ((sigma2_gxe * normalization[i]) * (gE.T @ v))
+                # beta_star = (beta_g * normalization + beta_gxe)
+
+                beta_g_s.append(beta_g)
+                beta_gxe_s.append(beta_gxe)
 
         return (asarray(beta_g_s), stack(beta_gxe_s).T)
 
-    def estimate_aggregate_environment(self, g):
+    def estimate_aggregate_environment(self, g, n_jobs: int = 1):
         g = atleast_2d(g).reshape((g.size, 1))
         E0 = self._E0
         gE = g * E0
         W = self._W
         M = concatenate((W, g, E0), axis=1)
-        best = {"lml": -inf, "rho1": 0}
-        hSigma_p = {}
-        for rho1 in self._rho1:
-            # Σₚ = ρ₁(𝐠⊙𝙴)(𝐠⊙𝙴)ᵀ + (1-ρ₁)𝙺⊙E
-            a = sqrt(rho1)
-            b = sqrt(1 - rho1)
-            hSigma_p[rho1] = concatenate([a * gE] + [b * L for L in self._Ls], axis=1)
-            # cov(𝐲) = 𝓋₁Σₚ + 𝓋₂𝙸
-            # lmm = Kron2Sum(Y, [[1]], M, hSigma_p[rho1], restricted=True)
-            QS = self._Sigma_qs[rho1]
-            lmm = LMM(self._y, M, QS, restricted=True)
-            lmm.fit(verbose=False)
-
-            if lmm.lml() > best["lml"]:
-                best["lml"] = lmm.lml()
-                best["rho1"] = rho1
-                best["lmm"] = lmm
+        # cov(𝐲) = 𝓋₁Σₚ + 𝓋₂𝙸
+        with _thread_pool(n_jobs) as executor:
+            best = self._fit_best_rho1(M, True, executor=executor)
 
         lmm = best["lmm"]
-        yadj = self._y - lmm.mean()
+        # yadj = 𝐲 - 𝙼𝛃
+        yadj = self._y - M @ lmm.beta
         # rho1 = best["rho1"]
         v1 = lmm.v0
         v2 = lmm.v1
         rho1 = best["rho1"]
         sigma2_gxe = rho1 * v1
-        hSigma_p_qs = economic_qs_linear(hSigma_p[rho1], return_q1=False)
+        # Σₚ = ρ₁(𝐠⊙𝙴)(𝐠⊙𝙴)ᵀ + (1-ρ₁)𝙺⊙E is only needed for the selected ρ₁
+        a = sqrt(rho1)
+        b = sqrt(1 - rho1)
+        hSigma_p = _scaled_hS(gE, self._cat_Ls, a, b)
+        hSigma_p_qs = gram_qs(hSigma_p)
         qscov = QSCov(hSigma_p_qs[0][0], hSigma_p_qs[1], v1, v2)
         # v = cov(𝐲)⁻¹yadj
         v = qscov.solve(yadj)
@@ -243,79 +292,50 @@ class CellRegMap:
 
         return E0 @ beta_gxe
 
-    def scan_association(self, G):
-        info = {"rho1": [], "e2": [], "g2": [], "eps2": []}
-
-        # NULL model
-        best = {"lml": -inf, "rho1": 0}
-        for rho1 in self._rho1:
-            QS = self._Sigma_qs[rho1]
-            # LRT for fixed effects requires ML rather than REML estimation
-            lmm = LMM(self._y, self._W, QS, restricted=False)
-            lmm.fit(verbose=False)
-
-            if lmm.lml() > best["lml"]:
-                best["lml"] = lmm.lml()
-                best["rho1"] = rho1
-                best["lmm"] = lmm
-
-        null_lmm = best["lmm"]
-        info["rho1"].append(best["rho1"])
-        info["e2"].append(null_lmm.v0 * best["rho1"])
-        info["g2"].append(null_lmm.v0 * (1 - best["rho1"]))
-        info["eps2"].append(null_lmm.v1)
-
-        n_snps = G.shape[1]
-        alt_lmls = []
-        for i in tqdm(range(n_snps)):
-            g = G[:, [i]]
-            X = concatenate((self._W, g), axis=1)
-            QS = self._Sigma_qs[best["rho1"]]
-            alt_lmm = LMM(self._y, X, QS, restricted=False)
-            alt_lmm.fit(verbose=False)
-            alt_lmls.append(alt_lmm.lml())
-
-        pvalues = lrt_pvalues(null_lmm.lml(), alt_lmls, dof=1)
-
-        info = {key: asarray(v, float) for key, v in info.items()}
-        return asarray(pvalues, float), info
-    
-    
-    def scan_association_fast(self, G):
-        info = {"rho1": [], "e2": [], "g2": [], "eps2": []}
+    def scan_association(self, G, n_jobs: int = 1):
+        # Dask arrays are read one column block at a time below
+        if not _is_dask_array(G):
+            G = _asarray_genotype(G)
 
         # NULL model
-        best = {"lml": -inf, "rho1": 0}
-        for rho1 in self._rho1:
-            QS = self._Sigma_qs[rho1]
-            # LRT for fixed effects requires ML rather than REML estimation
-            lmm = LMM(self._y, self._W, QS, restricted=False)
-            lmm.fit(verbose=False)
-
-            if lmm.lml() > best["lml"]:
-                best["lml"] = lmm.lml()
-                best["rho1"] = rho1
-                best["lmm"] = lmm
+        # LRT for fixed effects requires ML rather than REML estimation
+        with _thread_pool(n_jobs) as executor:
+            best = self._null_model(False, executor)[0]
 
         null_lmm = best["lmm"]
-        info["rho1"].append(best["rho1"])
-        info["e2"].append(null_lmm.v0 * best["rho1"])
-        info["g2"].append(null_lmm.v0 * (1 - best["rho1"]))
-        info["eps2"].append(null_lmm.v1)
-        
-        # Alternative model 
-        lmm = null_lmm
-        flmm = lmm.get_fast_scanner()
-        alt_lmls = flmm.fast_scan(G, verbose=False)['lml']
+        info = {
+            "rho1": full(1, best["rho1"]),
+            "e2": full(1, null_lmm.v0 * best["rho1"]),
+            "g2": full(1, null_lmm.v0 * (1 - best["rho1"])),
+            "eps2": full(1, null_lmm.v1),
+        }
+
+        # Alternative model: the fast scanner rotates 𝐲, W, and G by Q₀ᵀ once and
+        # then fits each SNP as a cheap update of the null solution. G is handed
+        # over in column-major double-precision blocks.
+        flmm = null_lmm.get_fast_scanner()
+        # empty(0) keeps the concatenation valid when G has no columns
+        alt_lmls = [empty(0)]
+        for _, block in _iter_blocks(G):
+            alt_lmls.append(flmm.fast_scan(block, verbose=False)["lml"])
+        alt_lmls = concatenate(alt_lmls)
 
         pvalues = lrt_pvalues(null_lmm.lml(), alt_lmls, dof=1)
 
-        info = {key: asarray(v, float) for key, v in info.items()}
-        return asarray(pvalues, float), info
+        return pvalues, info
 
+    def scan_association_fast(self, G, n_jobs: int = 1):
+        """
+        Same as :meth:`scan_association`, kept for backward compatibility.
+        """
+        return self.scan_association(G, n_jobs)
 
     def scan_interaction(
-        self, G, idx_E: Optional[any] = None, idx_G: Optional[any] = None
+        self,
+        G,
+        idx_E: Optional[any] = None,
+        idx_G: Optional[any] = None,
+        n_jobs: int = 1,
     ):
         """
         𝐲 = W𝛂 + 𝐠𝛽₁ + 𝐠⊙𝛃₂ + 𝐞 + 𝐮 + 𝛆
@@ -328,33 +348,36 @@ class CellRegMap:
 
         𝓗₀: 𝓋₃ = 0
         𝓗₁: 𝓋₃ > 0
+
+        SNPs are tested independently against the same null model. With `n_jobs` > 1,
+        that many threads fit the null model's ρ₁ grid and then test SNPs
+        concurrently; the Davies p-values themselves are computed one at a time.
         """
         # TODO: make sure G is nxp
         from chiscore import davies_pvalue
 
-        G = asarray(G, float)
+        # Dask arrays are read one column block at a time below
+        if not _is_dask_array(G):
+            G = _asarray_genotype(G)
         n_snps = G.shape[1]
-        pvalues = []
-        info = {"rho1": [], "e2": [], "g2": [], "eps2": []}
-
-        for i in tqdm(range(n_snps)):
-            g = G[:, [i]]
-            X = concatenate((self._W, g), axis=1)
-            best = {"lml": -inf, "rho1": 0}
-            # Null model fitting: find best (𝛂, 𝛽₁, 𝓋₁, 𝓋₂, ρ₁)
-            for rho1 in self._rho1:
-                # QS = self._Sigma_qs[rho1]
-                # halfSigma = self._halfSigma[rho1]
-                # Σ = ρ₁𝙴𝙴ᵀ + (1-ρ₁)𝙺⊙E
-                # cov(y₀) = 𝓋₁Σ + 𝓋₂I
-                QS = self._Sigma_qs[rho1]
-                lmm = LMM(self._y, X, QS, restricted=True)
-                lmm.fit(verbose=False)
-
-                if lmm.lml() > best["lml"]:
-                    best["lml"] = lmm.lml()
-                    best["rho1"] = rho1
-                    best["lmm"] = lmm
+        pvalues = empty(n_snps)
+
+        # Useful for permutation
+        if idx_E is None:
+            E0 = self._E0
+        else:
+            E0 = self._E0[idx_E, :]
+
+        # One pool serves the null fit and the SNP tests
+        with _thread_pool(n_jobs) as executor:
+            # Null model fitting: find best (𝛂, 𝓋₁, 𝓋₂, ρ₁) once for all SNPs.
+            # The variance components do not depend on 𝐠, so 𝐠𝛽₁ is only added to the
+            # fixed effects of P₀ below rather than refitting the LMM per SNP.
+            # Σ = ρ₁𝙴𝙴ᵀ + (1-ρ₁)𝙺⊙E
+            # cov(y₀) = 𝓋₁Σ + 𝓋₂I
+            # K₀⁻¹W and WᵀK₀⁻¹W are shared by every X = [W, 𝐠]
+            best, qscov, KiW = self._null_model(True, executor)
+            WtKiW = self._W.T @ KiW
 
             lmm = best["lmm"]
             # H1 via score test
@@ -363,81 +386,159 @@ class CellRegMap:
             # g²=𝓋₁(1-ρ₁)
             # 𝜀²=𝓋₂
             # with optimal values 𝓋₁ and 𝓋₂ found above.
-            info["rho1"].append(best["rho1"])
-            info["e2"].append(lmm.v0 * best["rho1"])
-            info["g2"].append(lmm.v0 * (1 - best["rho1"]))
-            info["eps2"].append(lmm.v1)
-            # QS = economic_decomp( Σ(ρ₁) )
-            Q0 = self._Sigma_qs[best["rho1"]][0][0]
-            S0 = self._Sigma_qs[best["rho1"]][1]
-            # e2 = best["lmm"].v0 * best["rho1"]
-            # g2 = best["lmm"].v0 * (1 - best["rho1"])
-            # eps2 = best["lmm"].v1
-            # EE = self._E @ self._E.T
-            # K = self._G @ self._G.T
-            # K0 = e2 * EE + g2 * K + eps2 * eye(K.shape[0])
-            qscov = QSCov(
-                Q0,
-                S0,
-                lmm.v0,  # 𝓋₁
-                lmm.v1,  # 𝓋₂
-            )
-            # start = time()
-            # qscov = QSCov(self._Sigma_qs[best["rho1"]], lmm.C0[0, 0], lmm.C1[0, 0])
-            # print(f"Elapsed: {time() - start}")
-            # X = concatenate((self._E, g), axis=1)
-            # X = concatenate((self._W, g), axis=1)
-
-            # Let P₀ = K₀⁻¹ - K₀⁻¹X(XᵀK₀⁻¹X)⁻¹XᵀK₀⁻¹.
-            P = PMat(qscov, X)
-            # P0 = inv(K0) - inv(K0) @ X @ inv(X.T @ inv(K0) @ X) @ X.T @ inv(K0)
-
-            # P₀𝐲 = K₀⁻¹𝐲 - K₀⁻¹X(XᵀK₀⁻¹X)⁻¹XᵀK₀⁻¹𝐲.
-
-            # Useful for permutation
-            if idx_E is None:
-                E0 = self._E0
+            info = {
+                "rho1": full(n_snps, best["rho1"]),
+                "e2": full(n_snps, lmm.v0 * best["rho1"]),
+                "g2": full(n_snps, lmm.v0 * (1 - best["rho1"])),
+                "eps2": full(n_snps, lmm.v1),
+            }
+            kW = self._W.shape[1]
+            # Each thread keeps its own X, K₀⁻¹X and XᵀK₀⁻¹X, only rewriting the parts
+            # that involve 𝐠
+            buffers = local()
+
+            def snps():
+                # K₀⁻¹𝐠 and XᵀK₀⁻¹𝐠 = [WᵀK₀⁻¹𝐠; 𝐠ᵀK₀⁻¹𝐠] for a whole block of SNPs
+                for start, block in _iter_blocks(G):
+                    KiB = qscov.solve(block)
+                    gtKiB = einsum("ij,ij->j", block, KiB)
+                    XtKiB = concatenate((self._W.T @ KiB, gtKiB[newaxis]), axis=0)
+                    for j in range(block.shape[1]):
+                        yield start + j, block[:, j : j + 1], KiB[:, j], XtKiB[:, j]
+
+            def test(snp):
+                i, g, Kig, XtKig = snp
+                if not hasattr(buffers, "X"):
+                    buffers.X = empty((self._W.shape[0], kW + 1))
+                    buffers.X[:, :kW] = self._W
+                    buffers.KiX = empty_like(buffers.X)
+                    buffers.KiX[:, :kW] = KiW
+                    buffers.XtKiX = empty((kW + 1, kW + 1))
+                    buffers.XtKiX[:kW, :kW] = WtKiW
+                X = buffers.X
+                X[:, kW:] = g
+                KiX = buffers.KiX
+                KiX[:, kW] = Kig
+                # XᵀK₀⁻¹X = [WᵀK₀⁻¹W WᵀK₀⁻¹𝐠; 𝐠ᵀK₀⁻¹W 𝐠ᵀK₀⁻¹𝐠]
+                XtKiX = buffers.XtKiX
+                XtKiX[:, kW] = XtKig
+                XtKiX[kW, :kW] = XtKig[:kW]
+
+                # Let P₀ = K₀⁻¹ - K₀⁻¹X(XᵀK₀⁻¹X)⁻¹XᵀK₀⁻¹.
+                # Only the K₀⁻¹𝐠 column of K₀⁻¹X is new for each SNP.
+                P = PMat(qscov, X, KiX, XtKiX)
+                # P0 = inv(K0) - inv(K0) @ X @ inv(X.T @ inv(K0) @ X) @ X.T @ inv(K0)
+
+                # P₀𝐲 = K₀⁻¹𝐲 - K₀⁻¹X(XᵀK₀⁻¹X)⁻¹XᵀK₀⁻¹𝐲.
+
+                # The covariance matrix of H1 is K = K₀ + 𝓋₃diag(𝐠)⋅𝙴𝙴ᵀ⋅diag(𝐠)
+                # We have ∂K/∂𝓋₃ = diag(𝐠)⋅𝙴𝙴ᵀ⋅diag(𝐠)
+                # The score test statistics is given by
+                # Q = ½𝐲ᵀP₀⋅∂K⋅P₀𝐲
+
+                # Useful for permutation
+                if idx_G is None:
+                    gtest = g.ravel()
+                else:
+                    gtest = g.ravel()[idx_G]
+
+                ss = ScoreStatistic(P, qscov, gtest[:, newaxis] * E0)
+                Q, dist_matrix = ss.statistic_and_matrix(self._y)
+                # Q is the score statistic for our interaction test and follows a linear
+                # combination
+                # of chi-squared (df=1) distributions:
+                # Q ∼ ∑λχ², where λᵢ are the non-zero eigenvalues of ½√P₀⋅∂K⋅√P₀.
+                # Since eigenvals(𝙰𝙰ᵀ) = eigenvals(𝙰ᵀ𝙰) (TODO: find citation),
+                # we can compute ½(√∂K)P₀(√∂K) instead.
+                # TODO: compare with Liu approximation, maybe try a computational
+                # intensive method
+                # chiscore's Davies routine is not known to be thread-safe (qfc-style
+                # code keeps state in globals), so only one thread runs it at a time
+                with _davies_lock:
+                    pval, pinfo = davies_pvalue(Q, dist_matrix, True)
+                pvalues[i] = pval
+
+            progress = tqdm(snps(), total=n_snps)
+            if executor is None:
+                for snp in progress:
+                    test(snp)
             else:
-                E0 = self._E0[idx_E, :]
+                # Submit in batches so that only a few genotype blocks are in memory
+                for batch in iter(lambda: list(islice(progress, 1024)), []):
+                    list(executor.map(test, batch))
 
-            # The covariance matrix of H1 is K = K₀ + 𝓋₃diag(𝐠)⋅𝙴𝙴ᵀ⋅diag(𝐠)
-            # We have ∂K/∂𝓋₃ = diag(𝐠)⋅𝙴𝙴ᵀ⋅diag(𝐠)
-            # The score test statistics is given by
-            # Q = ½𝐲ᵀP₀⋅∂K⋅P₀𝐲
-            # start = time()
+        return pvalues, info
 
-            # Useful for permutation
-            if idx_G is None:
-                gtest = g.ravel()
-            else:
-                gtest = g.ravel()[idx_G]
-
-            ss = ScoreStatistic(P, qscov, ddot(gtest, E0))
-            Q = ss.statistic(self._y)
-            # import numpy as np
-
-            # deltaK = np.diag(gtest) @ EE @ np.diag(gtest)
-            # Q_ = 0.5 * self._y.T @ P0 @ deltaK @ P0 @ self._y
-            # print(f"Elapsed: {time() - start}")
-            # Q is the score statistic for our interaction test and follows a linear
-            # combination
-            # of chi-squared (df=1) distributions:
-            # Q ∼ ∑λχ², where λᵢ are the non-zero eigenvalues of ½√P₀⋅∂K⋅√P₀.
-            # Since eigenvals(𝙰𝙰ᵀ) = eigenvals(𝙰ᵀ𝙰) (TODO: find citation),
-            # we can compute ½(√∂K)P₀(√∂K) instead.
-            # start = time()
-            # import scipy as sp
-            # sqrtm = sp.linalg.sqrtm
-            # np.linalg.eigvalsh(0.5 * sqrtm(P0) @ deltaK @ sqrtm(P0))
-            # np.linalg.eigvalsh(0.5 * sqrtm(deltaK) @ P0 @ sqrtm(deltaK))
-            # TODO: compare with Liu approximation, maybe try a computational intensive
-            # method
-            pval, pinfo = davies_pvalue(Q, ss.matrix_for_dist_weights(), True)
-            pvalues.append(pval)
-            # print(f"Elapsed: {time() - start}")
-
-        info = {key: asarray(v, float) for key, v in info.items()}
-        return asarray(pvalues, float), info
+
+# Serialises chiscore.davies_pvalue across the threads of scan_interaction
+_davies_lock = Lock()
+
+
+def _thread_pool(n_jobs):
+    """
+    Thread pool of `n_jobs` workers as a context manager, or ``None`` (i.e.,
+    sequential) for `n_jobs` = 1.
+
+    Each worker runs multithreaded BLAS; cap it (e.g., with ``OMP_NUM_THREADS``) when
+    `n_jobs` > 1 to avoid oversubscribing the cores.
+    """
+    if n_jobs == 1:
+        return nullcontext()
+    return ThreadPoolExecutor(n_jobs)
+
+
+def _scaled_hS(A, B, a, b):
+    """
+    Half-factor [𝑎𝙰 𝑏𝙱] of 𝑎²𝙰𝙰ᵀ + 𝑏²𝙱𝙱ᵀ, written block by block into one buffer.
+    """
+    kA = A.shape[1]
+    hS = empty((A.shape[0], kA + B.shape[1]))
+    multiply(A, a, out=hS[:, :kA])
+    multiply(B, b, out=hS[:, kA:])
+    return hS
+
+
+def _is_dask_array(G):
+    """
+    Whether ``G`` is a Dask array, which is sliced block by block without being
+    computed in full. Any other input goes through `_asarray_genotype`.
+    """
+    return type(G).__module__.startswith("dask.")
+
+
+def _asarray_genotype(G):
+    """
+    Convert ``G`` to an array without copying single- or double-precision input.
+
+    Single precision is meant for the exploratory scan phase: columns are cast to
+    double precision one block at a time (see `_iter_blocks`), so the full genotype
+    matrix is never duplicated.
+    """
+    G = asarray(G)
+    if G.dtype not in (float32, float64):
+        G = asarray(G, float)
+    return G
+
+
+def _iter_blocks(G, block_size=1024):
+    """
+    Yield ``(start, G[:, start:start + block_size])`` as double-precision blocks.
+
+    Only the current block is converted to an in-memory array, so a Dask-backed
+    matrix is never computed in full. Blocks are stored column-major, so each column
+    is a contiguous view rather than a copy.
+    """
+    for start in range(0, G.shape[1], block_size):
+        yield start, asarray(G[:, start : start + block_size], float, order="F")
+
+
+def _iter_snps(G, block_size=1024):
+    """
+    Yield ``(i, G[:, [i]])`` as double-precision columns, one block at a time.
+    """
+    for start, block in _iter_blocks(G, block_size):
+        for j in range(block.shape[1]):
+            yield start + j, block[:, j : j + 1]
 
 
 def lrt_pvalues(null_lml, alt_lmls, dof=1):
@@ -460,12 +561,8 @@ def lrt_pvalues(null_lml, alt_lmls, dof=1):
     pvalues : ndarray
         P-values.
     """
-    from numpy import clip
-    from numpy_sugar import epsilon
-    from scipy.stats import chi2
-
     lrs = clip(-2 * null_lml + 2 * asarray(alt_lmls, float), epsilon.super_tiny, inf)
-    pv = chi2(df=dof).sf(lrs)
+    pv = chdtrc(dof, lrs)
     return clip(pv, epsilon.super_tiny, 1 - epsilon.tiny)
 
 def run_association(y, W, E, G, hK=None):
@@ -540,8 +637,11 @@ def get_L_values(hK, E):
     [U, S, _] = economic_svd(E)
     us = U * S
 
-    # get decomposition of K \odot EEt
-    Ls = [ddot(us[:,i], hK) for i in range(us.shape[1])]
+    # get decomposition of K \odot EEt: Ls[i] = diag(us[:, i]) @ hK, computed for
+    # every i with a single broadcast product
+    hK = asarray(hK, float)
+    L = us[:, :, newaxis] * hK[:, newaxis, :]
+    Ls = [L[:, i, :] for i in range(us.shape[1])]
     return Ls
 
 def run_interaction(y, E, G, W=None, E1=None, E2=None, hK=None, idx_G=None):
@@ -613,10 +713,11 @@ def compute_maf(X):
     import dask.array as da
     import xarray as xr
     from pandas import DataFrame
-    from numpy import isnan, logical_not, minimum, nansum
+
     if isinstance(X, da.Array):
-        s0 = da.nansum(X, axis=0).compute()
-        denom = 2 * (X.shape[0] - da.isnan(X).sum(axis=0)).compute()
+        # a single compute shares the traversal of X between both reductions
+        s0, n_missing = da.compute(da.nansum(X, axis=0), da.isnan(X).sum(axis=0))
+        denom = 2 * (X.shape[0] - n_missing)
     elif isinstance(X, DataFrame):
         s0 = X.sum(axis=0, skipna=True)
         denom = 2 * logical_not(X.isna()).sum(axis=0)
@@ -24,10 +24,12 @@ References
    variant effects in sequencing association studies." Biostatistics 13.4 (2012):
    762-775.
 """
-from numpy import finfo, logical_not, sqrt
-from numpy.linalg import eigh, eigvalsh, inv, lstsq, solve, svd
+from numpy import asarray, clip, concatenate, eye, finfo, inf, logical_not, sqrt
+from numpy.linalg import eigh, lstsq, qr, svd
 from numpy_sugar import ddot
-from scipy.linalg import sqrtm
+from numpy_sugar.linalg import economic_svd
+from scipy.linalg import cho_factor, cho_solve, eigh as sp_eigh, solve
+from scipy.special import chdtri
 
 
 def rsolve(a, b):
@@ -70,33 +72,103 @@ class QSCov:
         R0 = 1 / (1 + ((self._a / self._b) * self._S0))
         # R0 = R[:rank]
         Q0v = self._Q0.T @ v
-        return (self._Q0 @ ddot(R0, Q0v, left=True) + v - self._Q0 @ Q0v) / self._b
+        # 𝚀₀𝚁₀𝚀₀ᵀ𝐯 + 𝐯 - 𝚀₀𝚀₀ᵀ𝐯 = 𝐯 + 𝚀₀(𝚁₀ - 𝙸)𝚀₀ᵀ𝐯, with a single product by 𝚀₀
+        # whose output is then updated in place
+        x = self._Q0 @ ddot(R0 - 1, Q0v, left=True)
+        x += v
+        x /= self._b
+        return x
         # left = self._Q0 @ ddot(R0, self._Q0.T @ v, left=True)
         # right = self._Q1 @ ddot(R1, self._Q1.T @ v, left=True)
         # return (left + right) / self._b
 
 
+class BlockQS:
+    """
+    Economic eigen decomposition of [𝑎𝙰 𝑏𝙱][𝑎𝙰 𝑏𝙱]ᵀ = 𝑎²𝙰𝙰ᵀ + 𝑏²𝙱𝙱ᵀ for many (𝑎, 𝑏).
+
+    𝙰 and 𝙱 are factorised only once, 𝙰 = 𝚄ₐ𝚂ₐ𝚅ₐᵀ and 𝙱 = 𝚄ᵦ𝚂ᵦ𝚅ᵦᵀ, together with the
+    economic QR decomposition [𝚄ₐ 𝚄ᵦ] = 𝚀𝚁. We then have
+
+        𝑎²𝙰𝙰ᵀ + 𝑏²𝙱𝙱ᵀ = 𝚀(𝚁𝙳𝚁ᵀ)𝚀ᵀ,   𝙳 = diag(𝑎²𝚂ₐ², 𝑏²𝚂ᵦ²),
+
+    and each (𝑎, 𝑏) only requires the eigen decomposition of the small matrix 𝚁𝙳𝚁ᵀ.
+    When only 𝙰 changes (e.g., 𝙰 = 𝐠⊙𝙴 for each SNP), `set_A` keeps the
+    factorisation of 𝙱.
+    """
+
+    def __init__(self, A, B, epsilon=sqrt(finfo(float).eps)):
+        self._Ub, Sb, _ = economic_svd(B)
+        self._Sb2 = Sb ** 2
+        self._epsilon = epsilon
+        self.set_A(A)
+
+    def set_A(self, A):
+        Ua, Sa, _ = economic_svd(A)
+        self._Q, self._R = qr(concatenate((Ua, self._Ub), axis=1))
+        self._Sa2 = Sa ** 2
+
+    def __call__(self, a, b):
+        """
+        Returns ``((Q0,), S0)``, as ``economic_qs_linear(G, return_q1=False)`` does.
+        """
+        D = concatenate((a ** 2 * self._Sa2, b ** 2 * self._Sb2))
+        S, V = eigh(ddot(self._R, D) @ self._R.T)
+        ok = S >= self._epsilon
+        return ((self._Q @ V[:, ok],), S[ok])
+
+
+def gram_qs(G, epsilon=sqrt(finfo(float).eps)):
+    """
+    Economic eigen decomposition of 𝙶𝙶ᵀ, returned as ``((Q0,), S0)``.
+
+    The eigen decomposition is computed on the smaller of the Gram matrices. For a
+    tall 𝙶, 𝙶ᵀ𝙶 = 𝚅𝚂𝚅ᵀ gives 𝚀₀ = 𝙶𝚅𝚂^(-½); otherwise 𝙶𝙶ᵀ is decomposed directly.
+    """
+    if G.shape[0] > G.shape[1]:
+        S, V = sp_eigh(G.T @ G, driver="evr", check_finite=False)
+        ok = S >= epsilon
+        S0 = S[ok]
+        return ((G @ (V[:, ok] / sqrt(S0)),), S0)
+
+    S, Q = sp_eigh(G @ G.T, driver="evr", check_finite=False)
+    ok = S >= epsilon
+    return ((Q[:, ok],), S[ok])
+
+
 class PMat:
     """
     Represents 𝙿 = 𝙺⁻¹ - 𝙺⁻¹𝚆(𝚆ᵀ𝙺⁻¹𝚆)⁻¹𝚆ᵀ𝙺⁻¹.
 
-    The 𝙺 is defined via an `QSCov` object.
+    The 𝙺 is defined via an `QSCov` object. 𝙺⁻¹𝚆 and 𝚆ᵀ𝙺⁻¹𝚆 can be passed in as
+    `KiW` and `WtKiW` when they are already known (e.g., when only a column of 𝚆
+    changes between calls).
     """
 
-    def __init__(self, qscov: QSCov, W):
+    def __init__(self, qscov: QSCov, W, KiW=None, WtKiW=None):
         self._qscov = qscov
         self._W = W
-        self._KiW = self._qscov.solve(self._W)
+        if KiW is None:
+            KiW = self._qscov.solve(self._W)
+        self._KiW = KiW
+        if WtKiW is None:
+            WtKiW = self._W.T @ self._KiW
+        self._WtKiW = WtKiW
 
     def dot(self, v):
         Kiv = self._qscov.solve(v)
-        return Kiv - self._KiW @ rsolve(self._W.T @ self._KiW, self._KiW.T @ v)
+        return Kiv - self._KiW @ rsolve(self._WtKiW, self._KiW.T @ v)
 
 
 def P_matrix(W, K):
     """ Computes 𝙿 = 𝙺⁻¹ - 𝙺⁻¹𝚆(𝚆ᵀ𝙺⁻¹𝚆)⁻¹𝚆ᵀ𝙺⁻¹. """
-    KiW = solve(K, W)
-    return inv(K) - KiW @ solve(W.T @ KiW, KiW.T)
+    # 𝙺 is a covariance matrix: a single Cholesky factor serves both 𝙺⁻¹ and 𝙺⁻¹𝚆
+    c = cho_factor(K)
+    KiW = cho_solve(c, W)
+    # 𝚆ᵀ𝙺⁻¹𝚆 is positive definite as well
+    return cho_solve(c, eye(K.shape[0])) - KiW @ solve(
+        W.T @ KiW, KiW.T, assume_a="pos"
+    )
 
 
 class ScoreStatistic:
@@ -114,7 +186,9 @@ class ScoreStatistic:
     def statistic(self, y):
         """ Compute 𝑄 = ½𝐲ᵀ𝙿(∂𝙺)𝙿𝐲. """
         Py = self._P.dot(y)
-        return Py.T @ self._sqrt_dK @ self._sqrt_dK.T @ Py / 2
+        # 𝑄 = ½‖(√∂𝙺)ᵀ𝙿𝐲‖², without forming the n-vector (∂𝙺)𝙿𝐲
+        t = self._sqrt_dK.T @ Py
+        return t.T @ t / 2
 
     def matrix_for_dist_weights(self):
         """Compute ½(√∂𝙺)𝙿(√∂𝙺).
@@ -123,9 +197,25 @@ class ScoreStatistic:
         """
         return self._sqrt_dK.T @ self._P.dot(self._sqrt_dK) / 2
 
+    def statistic_and_matrix(self, y):
+        """
+        Same as ``(statistic(y), matrix_for_dist_weights())``, applying 𝙿 to
+        [𝐲 √∂𝙺] in a single product.
+        """
+        PZ = self._P.dot(concatenate((y.reshape(-1, 1), self._sqrt_dK), axis=1))
+        # (√∂𝙺)ᵀ𝙿[𝐲 √∂𝙺] = [𝐭 2𝙼], where 𝑄 = ½𝐭ᵀ𝐭 and 𝙼 is the weight matrix
+        T = self._sqrt_dK.T @ PZ
+        t = T[:, 0]
+        return t @ t / 2, T[:, 1:] / 2
+
     def distr_weights(self):
-        weights = eigvalsh(self.matrix_for_dist_weights())
-        return weights[weights > 1e-16]
+        # Only the eigenvalues above the threshold are computed
+        return sp_eigh(
+            self.matrix_for_dist_weights(),
+            eigvals_only=True,
+            subset_by_value=(1e-16, inf),
+            driver="evr",
+        )
 
 
 def score_statistic(y, W, K, dK):
@@ -135,7 +225,9 @@ def score_statistic(y, W, K, dK):
         𝑄 = ½𝐲ᵀ𝙿(∂𝙺)𝙿𝐲.
     """
     P = P_matrix(W, K)
-    return y.T @ P @ dK @ P @ y / 2
+    # 𝙿 is symmetric, so 𝐲ᵀ𝙿 = (𝙿𝐲)ᵀ
+    Py = P @ y
+    return Py.T @ dK @ Py / 2
 
 
 def score_statistic_qs(y, W, qscov, dK):
@@ -156,8 +248,14 @@ def score_statistic_distr_weights(W, K, dK):
     where 𝜆ᵢ are the non-zero eigenvalues of ½√𝙿(∂𝙺)√𝙿.
     """
     P = P_matrix(W, K)
-    weights = eigvalsh(sqrtm(P) @ dK @ sqrtm(P)) / 2
-    return weights[weights > 1e-16]
+    # With 𝙿 = 𝚅𝚂𝚅ᵀ, ½√𝙿(∂𝙺)√𝙿 shares its non-zero eigenvalues with ½𝙷ᵀ(∂𝙺)𝙷 for
+    # 𝙷 = 𝚅√𝚂, which avoids the Schur-based matrix square root.
+    S, V = eigh(P)
+    H = V * sqrt(clip(S, 0, None))
+    weights = sp_eigh(
+        H.T @ dK @ H, eigvals_only=True, subset_by_value=(2e-16, inf), driver="evr"
+    )
+    return weights / 2
 
 
 def score_statistic_liu_params(q, weights):
@@ -181,24 +279,17 @@ def score_statistic_liu_params(q, weights):
 
 
 def qmin(liu_params):
-    import scipy.stats as st
-    from numpy import zeros
-
-    n = len(liu_params)
-
     # T statistic
     T = min(i["pv"] for i in liu_params)
 
-    qmin = zeros(n)
-    percentile = 1 - T
-    for i in range(n):
-        q = st.chi2.ppf(percentile, liu_params[i]["dof_x"])
-        mu_q = liu_params[i]["mu_q"]
-        sigma_q = liu_params[i]["sigma_q"]
-        dof = liu_params[i]["dof_x"]
-        qmin[i] = (q - dof) / (2 * dof) ** 0.5 * sigma_q + mu_q
+    mu_q = asarray([i["mu_q"] for i in liu_params], float)
+    sigma_q = asarray([i["sigma_q"] for i in liu_params], float)
+    dof = asarray([i["dof_x"] for i in liu_params], float)
 
-    return qmin
+    # All quantiles share the same percentile, so they are computed in one call.
+    # chdtri is the inverse survival function behind chi2.ppf(1 - T, dof).
+    q = chdtri(dof, T)
+    return (q - dof) / sqrt(2 * dof) * sigma_q + mu_q
 
 
 def economic_qs(K, epsilon=sqrt(finfo(float).eps)):
@@ -223,8 +314,6 @@ def economic_qs(K, epsilon=sqrt(finfo(float).eps)):
     nok = abs(max(Q[0].min(), Q[0].max(), key=abs)) < epsilon
     nok = nok and abs(max(K.min(), K.max(), key=abs)) >= epsilon
     if nok:
-        from scipy.linalg import eigh as sp_eigh
-
         (S, Q) = sp_eigh(K)
 
     ok = S >= epsilon
@@ -1,23 +1,28 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Union
 
 from numpy import (
     array_split,
     asarray,
+    broadcast_to,
+    concatenate,
     cumsum,
+    diag_indices_from,
+    einsum,
     errstate,
-    eye,
+    flatnonzero,
+    int8,
     isscalar,
     ones,
     repeat,
     split,
     sqrt,
-    stack,
     zeros,
 )
-from numpy.random import Generator
+from numpy.random import Generator, RandomState, SeedSequence, default_rng
 from numpy_sugar import ddot
-from numpy_sugar.linalg import economic_svd
+from numpy_sugar.linalg import economic_qs
 
 from ._types import Term
 
@@ -31,27 +36,60 @@ SimulationFixedGxE = namedtuple(
 )
 
 
+def _as_rng(random) -> Generator:
+    """
+    Seeds (or ``None``) become a ``Generator``; generators, including legacy
+    ``RandomState`` ones, are used as given so that their streams are preserved.
+    """
+    if isinstance(random, (Generator, RandomState)):
+        return random
+    return default_rng(random)
+
+
 def sample_maf(n_snps: int, maf_min: float, maf_max: float, random: Generator):
     assert maf_min <= maf_max and maf_min >= 0 and maf_max <= 1
     return random.random(n_snps) * (maf_max - maf_min) + maf_min
 
 
 def sample_genotype(n_samples: int, mafs, random):
-    G = []
-    mafs = asarray(mafs, float)
-    for maf in mafs:
-        probs = [(1 - maf) ** 2, 1 - ((1 - maf) ** 2 + maf ** 2), maf ** 2]
-        g = random.choice([0, 1, 2], p=probs, size=n_samples)
-        G.append(asarray(g, float))
+    """
+    Under Hardy-Weinberg equilibrium the number of minor alleles of a SNP with
+    frequency 𝑝 follows Binomial(2, 𝑝): (1-𝑝)², 2𝑝(1-𝑝), and 𝑝² for 0, 1, and 2.
 
-    return stack(G, axis=1)
+    Allele counts are returned as ``int8``; they are converted to floating point
+    when normalised.
+    """
+    mafs = asarray(mafs, float)
+    G = random.binomial(2, mafs, size=(n_samples, len(mafs)))
+    return asarray(G, int8)
 
 
 def column_normalize(X):
     X = asarray(X, float)
+    X = X - X.mean(0)
 
+    # the centred copy is normalised in place by its column norms
     with errstate(divide="raise", invalid="raise"):
-        return (X - X.mean(0)) / X.std(0)
+        X /= sqrt(einsum("i...,i...->...", X, X) / X.shape[0])
+    return X
+
+
+def _repeat_normalize(G, n_cells):
+    """
+    Same as ``column_normalize(repeat(G, n_cells, axis=0))``, but with the column
+    moments taken over the individuals, weighted by their number of cells, and
+    returned in Fortran order.
+    """
+    G = asarray(G, float)
+    w = broadcast_to(asarray(n_cells, float), G.shape[:1])
+    w = w / w.sum()
+
+    G = G - w @ G
+    with errstate(divide="raise", invalid="raise"):
+        G /= sqrt(w @ (G * G))
+    # Repeating the transpose yields a column-major result: the samplers read G
+    # one (causal) column at a time.
+    return repeat(G.T, n_cells, axis=1).T
 
 
 def create_environment_matrix(
@@ -59,10 +97,10 @@ def create_environment_matrix(
 ):
     E = random.normal(size=[n_samples, n_env])
     E = column_normalize(E)
-    EE = E @ E.T
-    EE /= EE.diagonal().mean()
-    H = sample_covariance_matrix(n_samples, groups)[1]
-    M = EE + H
+    # M = 𝙴𝙴ᵀ/mean(diag(𝙴𝙴ᵀ)) + 𝙷, accumulated in the 𝙴𝙴ᵀ buffer
+    M = E @ E.T
+    M /= M.diagonal().mean()
+    M += sample_covariance_matrix(n_samples, groups)[1]
     M /= M.diagonal().mean()
     jitter(M)
     return _symmetric_decomp(M)
@@ -74,29 +112,46 @@ def create_environment_vector(
     E = zeros((n_samples, 1))
 
     values = random.choice([-1, 1], 2, False)
-    for value, group in zip(values, groups):
-        E[group, 0] = value
+    # Only the first len(values) groups are assigned a value
+    k = min(len(values), len(groups))
+    if k == 0:
+        return E
+    groups = [asarray(group, int) for group in groups[:k]]
+    E[concatenate(groups), 0] = repeat(values[:k], [len(group) for group in groups])
 
     return E
 
 
 def sample_covariance_matrix(n_samples: int, groups: List[List[int]]):
+    """
+    Group covariance 𝙺 = 𝚇𝚇ᵀ/mean(diag(𝚇𝚇ᵀ)), where 𝚇 is the sample-by-group
+    indicator matrix.
+
+    Returns
+    -------
+    X : ndarray
+        Scaled group-indicator factor 𝚇/√mean(diag(𝚇𝚇ᵀ)) of shape
+        ``(n_samples, len(groups))``, whose outer product is 𝙺 up to the jitter.
+    K : ndarray
+        Jittered covariance 𝙺 of shape ``(n_samples, n_samples)``.
+    """
     X = zeros((n_samples, len(groups)))
 
     for i, idx in enumerate(groups):
         X[idx, i] = 1.0
 
+    # mean(diag(𝚇𝚇ᵀ)) is the mean squared row norm of 𝚇
+    X /= sqrt(einsum("ij,ij->", X, X) / n_samples)
     K = X @ X.T
-    K /= K.diagonal().mean()
     jitter(K)
 
-    return (_symmetric_decomp(K), K)
+    return (X, K)
 
 
 def jitter(K):
     with errstate(divide="raise", invalid="raise"):
         # This small diagonal offset is to guarantee the full-rankness.
-        K += 1e-8 * eye(K.shape[0])
+        K[diag_indices_from(K)] += 1e-8
 
     return K
 
@@ -194,15 +249,19 @@ def sample_persistent_effsizes(
     if variance == 0.0:
         return effsizes
 
-    effsizes[causal_indices] = random.choice([+1, -1], size=len(causal_indices))
+    # Same draws as random.choice([+1, -1]) without its generic sampling overhead
+    integers = random.integers if isinstance(random, Generator) else random.randint
+    signs = 1.0 - 2.0 * integers(0, 2, size=n_causals)
     with errstate(divide="raise", invalid="raise"):
-        effsizes *= sqrt(variance / n_causals)
+        effsizes[causal_indices] = signs * sqrt(variance / n_causals)
 
     return effsizes
 
 
 def sample_persistent_effects(X, effsizes, variance: float):
-    y_g = X @ effsizes
+    # only the causal columns of 𝚇 contribute to 𝚇𝛃
+    causal = flatnonzero(effsizes)
+    y_g = X[:, causal] @ effsizes[causal]
     if variance > 0:
         _ensure_moments(y_g, 0, variance)
     return y_g
@@ -243,45 +302,25 @@ def sample_gxe_effects(G, E, causal_indices: list, variance: float, random: Gene
         return y2
 
     vi = variance / n_causals
-    for causal in causal_indices:
-        # 𝜶ᵢ ∼ 𝓝(𝟎, 𝜎ᵢ²I)
-        alpha = sqrt(vi) * random.normal(size=n_envs)
+    # 𝜶ᵢ ∼ 𝓝(𝟎, 𝜎ᵢ²I), one column per causal SNP
+    alpha = sqrt(vi) * random.normal(size=(n_causals, n_envs)).T
 
-        # Make the sample statistics close to population
-        # statistics
-        if n_envs > 1:
-            _ensure_moments(alpha, 0, sqrt(vi))
+    # Make the sample statistics close to population
+    # statistics
+    if n_envs > 1:
+        _ensure_moments(alpha, 0, sqrt(vi))
 
-        # 𝜷 = 𝛜ᵀ𝜶ᵢ
-        beta = E @ alpha
+    # 𝜷ᵢ = 𝛜ᵀ𝜶ᵢ for all causal SNPs at once
+    beta = E @ alpha
 
-        # 𝑔ᵢ⋅𝛜ᵀ𝜶ᵢ
-        y2 += G[:, causal] * beta
+    # ∑ᵢ𝑔ᵢ⋅𝛜ᵀ𝜶ᵢ
+    y2 += einsum("ij,ij->i", G[:, causal_indices], beta)
 
     _ensure_moments(y2, 0, variance)
 
     return y2
 
 
-# def sample_environment_effects(E, variance: float, random):
-#     from numpy import sqrt
-
-#     n_envs = E.shape[1]
-#     effsizes = sqrt(variance) * random.randn(n_envs)
-#     y3 = E @ effsizes
-
-#     _ensure_moments(y3, 0, variance)
-
-#     return y3
-
-
-# def sample_random_effect(K, variance: float, random: Generator):
-#     y = random.multivariate_normal(zeros(K.shape[0]), K, method="cholesky")
-
-#     _ensure_moments(y, 0, variance)
-
-#     return y
-
 def _sample_random_effect(X, variance: float, random: Generator):
     u = sqrt(variance) * random.normal(size=X.shape[1])
     y = X @ u
@@ -292,6 +331,11 @@ def _sample_random_effect(X, variance: float, random: Generator):
 
 
 def sample_random_effect(X, variance: float, random: Generator):
+    """
+    Sample 𝐲 = 𝚇𝐮 with 𝐮 ∼ 𝓝(𝟎, 𝓋𝙸), so that 𝐲 ∼ 𝓝(𝟎, 𝓋𝚇𝚇ᵀ) without ever forming
+    or factorising 𝚇𝚇ᵀ. `X` can also be a tuple of factors, in which case their
+    contributions are summed.
+    """
     if not isinstance(X, tuple):
         return _sample_random_effect(X, variance, random)
 
@@ -305,6 +349,19 @@ def sample_random_effect(X, variance: float, random: Generator):
     return y
 
 
+def _sample_hadamard_effect(E, L, variance: float, random: Generator):
+    """
+    Same as ``sample_random_effect(tuple(ddot(E[:, i], L) for i in ...), ...)``,
+    which samples from 𝓝(𝟎, 𝓋𝙻𝙻ᵀ⊙𝙴𝙴ᵀ), computed as ∑ᵢdiag(𝐞ᵢ)𝙻𝐮ᵢ = rowsum(𝙴⊙𝙻𝚄ᵀ)
+    with a single matrix product.
+    """
+    U = sqrt(variance) * random.normal(size=(E.shape[1], L.shape[1]))
+    y = einsum("ij,ij->i", E, L @ U.T)
+    _ensure_moments(y, 0, variance)
+
+    return y
+
+
 def sample_noise_effects(n_samples: int, variance: float, random: Generator):
     y5 = sqrt(variance) * random.normal(size=n_samples)
     _ensure_moments(y5, 0, variance)
@@ -331,12 +388,14 @@ def sample_phenotype_gxe(
     ----------
     n_cells
          Integer number of array of integers.
+    random
+         Random number generator, or a seed for ``numpy.random.default_rng``.
     """
+    random = _as_rng(random)
     mafs = sample_maf(n_snps, maf_min, maf_max, random)
 
     G = sample_genotype(n_individuals, mafs, random)
-    G = repeat(G, n_cells, axis=0)
-    G = column_normalize(G)
+    G = _repeat_normalize(G, n_cells)
 
     n_samples = G.shape[0]
 
@@ -350,16 +409,15 @@ def sample_phenotype_gxe(
     E = sample_covariance_matrix(n_samples, env_groups)[0]
 
     Lk, K = sample_covariance_matrix(n_samples, individual_groups)
-    [U, S, _] = economic_svd(E)
-    us = U * S
-    Ls = tuple([ddot(us[:, i], Lk) for i in range(us.shape[1])])
+    # 𝙺⊙𝙴𝙴ᵀ = ∑ᵢdiag(𝐞ᵢ)𝙻ₖ𝙻ₖᵀdiag(𝐞ᵢ); the group factor 𝙴 needs no decomposition
+    Ls = tuple([ddot(E[:, i], Lk) for i in range(E.shape[1])])
 
     beta_g = sample_persistent_effsizes(n_snps, g_causals, variances.g, random)
     y_g = sample_persistent_effects(G, beta_g, variances.g)
 
     y_gxe = sample_gxe_effects(G, E, gxe_causals, variances.gxe, random)
 
-    y_k = sample_random_effect(Ls, variances.k, random)
+    y_k = _sample_hadamard_effect(E, Lk, variances.k, random)
 
     if env_term is Term.RANDOM:
         y_e = sample_random_effect(E, variances.e, random)
@@ -397,6 +455,118 @@ def sample_phenotype_gxe(
     return simulation
 
 
+class SimulationContext:
+    """
+    Genotypes, environment factor, and kinship of a simulated cohort.
+
+    These are the expensive parts of :func:`sample_phenotype` and do not depend on
+    the variances or on the causal SNPs. Build them once and call :meth:`draw` for
+    every point of a sweep.
+    """
+
+    def __init__(
+        self,
+        n_individuals: int,
+        n_snps: int,
+        n_cells: Union[int, List[int]],
+        n_env: int,
+        n_env_groups: int,
+        maf_min: float,
+        maf_max: float,
+        random: Generator,
+    ):
+        random = _as_rng(random)
+        self.mafs = sample_maf(n_snps, maf_min, maf_max, random)
+
+        G = sample_genotype(n_individuals, self.mafs, random)
+        self.G = _repeat_normalize(G, n_cells)
+
+        n_samples = self.G.shape[0]
+        individual_groups = array_split(range(n_samples), n_individuals)
+
+        env_groups = array_split(random.permutation(range(n_samples)), n_env_groups)
+        self.E = create_environment_matrix(n_samples, n_env, env_groups, random)
+
+        self.Lk, self.K = sample_covariance_matrix(n_samples, individual_groups)
+        self.M = ones((n_samples, 1))
+
+    def draw(
+        self,
+        offset: float,
+        g_causals: list,
+        gxe_causals: list,
+        variances: Variances,
+        random: Generator,
+    ) -> Simulation:
+        random = _as_rng(random)
+        G = self.G
+        E = self.E
+
+        beta_g = sample_persistent_effsizes(G.shape[1], g_causals, variances.g, random)
+
+        y_g = sample_persistent_effects(G, beta_g, variances.g)
+
+        y_gxe = sample_gxe_effects(G, E, gxe_causals, variances.gxe, random)
+
+        y_k = sample_random_effect(self.Lk, variances.k, random)
+
+        y_e = sample_random_effect(E, variances.e, random)
+
+        y_n = sample_noise_effects(G.shape[0], variances.n, random)
+
+        y = offset + y_g + y_gxe + y_k + y_e + y_n
+
+        simulation = Simulation(
+            mafs=self.mafs,
+            offset=offset,
+            beta_g=beta_g,
+            y_g=y_g,
+            y_gxe=y_gxe,
+            y_k=y_k,
+            y_e=y_e,
+            y_n=y_n,
+            y=y,
+            variances=variances,
+            Lk=self.Lk,
+            Ls=None,
+            K=self.K,
+            E=E,
+            G=G,
+            M=self.M,
+        )
+
+        return simulation
+
+    def draw_many(
+        self,
+        n_draws: int,
+        offset: float,
+        g_causals: list,
+        gxe_causals: list,
+        variances: Variances,
+        random: Generator,
+        n_jobs: int = 1,
+    ) -> List[Simulation]:
+        """
+        Independent :meth:`draw` replicates on ``n_jobs`` threads.
+
+        Each replicate gets its own generator spawned from ``random``, so the
+        result does not depend on ``n_jobs``.
+        """
+        random = _as_rng(random)
+        integers = random.integers if isinstance(random, Generator) else random.randint
+        entropy = [int(i) for i in integers(0, 2 ** 31, size=4)]
+        rngs = [default_rng(s) for s in SeedSequence(entropy).spawn(n_draws)]
+
+        def draw(rng):
+            return self.draw(offset, g_causals, gxe_causals, variances, rng)
+
+        if n_jobs == 1:
+            return [draw(rng) for rng in rngs]
+        with ThreadPoolExecutor(n_jobs) as executor:
+            return list(executor.map(draw, rngs))
+
+
 def sample_phenotype(
     offset: float,
     n_individuals: int,
@@ -416,64 +586,25 @@ def sample_phenotype(
     ----------
     n_cells
          Integer number of array of integers.
+    random
+         Random number generator, or a seed for ``numpy.random.default_rng``.
     """
-    mafs = sample_maf(n_snps, maf_min, maf_max, random)
-
-    G = sample_genotype(n_individuals, mafs, random)
-    G = repeat(G, n_cells, axis=0)
-    G = column_normalize(G)
-
-    n_samples = G.shape[0]
-    individual_groups = array_split(range(n_samples), n_individuals)
-
-    env_groups = array_split(random.permutation(range(n_samples)), n_env_groups)
-    E = create_environment_matrix(n_samples, n_env, env_groups, random)
-
-    Lk, K = sample_covariance_matrix(n_samples, individual_groups)
-
-    beta_g = sample_persistent_effsizes(n_snps, g_causals, variances.g, random)
-
-    y_g = sample_persistent_effects(G, beta_g, variances.g)
-
-    y_gxe = sample_gxe_effects(G, E, gxe_causals, variances.gxe, random)
-
-    y_k = sample_random_effect(Lk, variances.k, random)
-
-    y_e = sample_random_effect(E, variances.e, random)
-
-    y_n = sample_noise_effects(n_samples, variances.n, random)
-
-    M = ones((K.shape[0], 1))
-    y = offset + y_g + y_gxe + y_k + y_e + y_n
-
-    simulation = Simulation(
-        mafs=mafs,
-        offset=offset,
-        beta_g=beta_g,
-        y_g=y_g,
-        y_gxe=y_gxe,
-        y_k=y_k,
-        y_e=y_e,
-        y_n=y_n,
-        y=y,
-        variances=variances,
-        Lk=Lk,
-        K=K,
-        E=E,
-        G=G,
-        M=M,
+    random = _as_rng(random)
+    context = SimulationContext(
+        n_individuals, n_snps, n_cells, n_env, n_env_groups, maf_min, maf_max, random
     )
-
-    return simulation
+    return context.draw(offset, g_causals, gxe_causals, variances, random)
 
 
 def _ensure_moments(arr, mean: float, variance: float):
     arr -= arr.mean(0) + mean
+    # arr now has mean -mean, so its variance follows from the second moment
+    var = einsum("i...,i...->...", arr, arr) / arr.shape[0] - mean * mean
     with errstate(divide="raise", invalid="raise"):
-        arr /= arr.std(0)
-    arr *= sqrt(variance)
+        arr *= sqrt(variance) / sqrt(var)
 
 
 def _symmetric_decomp(H):
-    [U, S, _] = economic_svd(H)
-    return ddot(U, sqrt(S))
+    # 𝙷 is symmetric positive semi-definite: its eigen decomposition is its SVD
+    (Q0, _), S0 = economic_qs(H)
+    return ddot(Q0, sqrt(S0))
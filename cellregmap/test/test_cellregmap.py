@@ -0,0 +1,95 @@
+import sys
+from types import ModuleType
+
+import pytest
+from numpy import exp, trace
+from numpy.random import default_rng
+from numpy.testing import assert_allclose, assert_equal
+
+from cellregmap import CellRegMap
+
+
+@pytest.fixture
+def davies_pvalue(monkeypatch):
+    """
+    chiscore's `davies_pvalue`, or a deterministic stand-in when it is not installed.
+    """
+    try:
+        from chiscore import davies_pvalue
+    except ImportError:
+        chiscore = ModuleType("chiscore")
+
+        def davies_pvalue(q, matrix, _):
+            return float(exp(-q / trace(matrix))), {}
+
+        chiscore.davies_pvalue = davies_pvalue
+        monkeypatch.setitem(sys.modules, "chiscore", chiscore)
+    return davies_pvalue
+
+
+@pytest.fixture
+def data():
+    random = default_rng(0)
+    n_samples = 40
+    y = random.normal(size=n_samples)
+    E = random.normal(size=(n_samples, 3))
+    hK = random.normal(size=(n_samples, 4))
+    G = random.integers(0, 3, size=(n_samples, 5)).astype(float)
+    return {"y": y, "E": E, "hK": hK, "G": G}
+
+
+def test_scan_genotype_list(data, davies_pvalue):
+    crm = CellRegMap(data["y"], data["E"], hK=data["hK"])
+    G = data["G"]
+
+    pv = crm.scan_association(G)[0]
+    assert_allclose(crm.scan_association(G.tolist())[0], pv)
+    pv = crm.scan_interaction(G)[0]
+    assert_allclose(crm.scan_interaction(G.tolist())[0], pv)
+
+
+def test_scan_genotype_dataframe(data, davies_pvalue):
+    pandas = pytest.importorskip("pandas")
+    crm = CellRegMap(data["y"], data["E"], hK=data["hK"])
+    G = data["G"]
+    df = pandas.DataFrame(G)
+
+    pv = crm.scan_association(G)[0]
+    assert_allclose(crm.scan_association(df)[0], pv)
+    pv = crm.scan_interaction(G)[0]
+    assert_allclose(crm.scan_interaction(df)[0], pv)
+
+
+def test_predict_interaction_n_jobs(data):
+    Ls = [data["hK"][:, :2], data["hK"][:, 2:]]
+    crm = CellRegMap(data["y"], data["E"], Ls=Ls)
+    G = data["G"][:, :3]
+    maf = [0.3, 0.2, 0.4]
+
+    beta_g, beta_gxe = crm.predict_interaction(G, maf)
+    beta_g_, beta_gxe_ = crm.predict_interaction(G, maf, n_jobs=2)
+    assert_allclose(beta_g_, beta_g)
+    assert_allclose(beta_gxe_, beta_gxe)
+
+
+def test_scan_interaction_n_jobs(data, davies_pvalue):
+    crm = CellRegMap(data["y"], data["E"], hK=data["hK"])
+    G = data["G"]
+
+    pv, info = crm.scan_interaction(G)
+    # A new instance, so that the null model is also fitted by the pool
+    crm = CellRegMap(data["y"], data["E"], hK=data["hK"])
+    pv_, info_ = crm.scan_interaction(G, n_jobs=2)
+    assert_allclose(pv_, pv)
+    for k in info:
+        assert_allclose(info_[k], info[k])
+
+
+def test_scan_no_snps(data, davies_pvalue):
+    crm = CellRegMap(data["y"], data["E"], hK=data["hK"])
+    G = data["G"][:, :0]
+
+    pv, info = crm.scan_association(G)
+    assert_equal(pv.shape, (0,))
+    pv, info = crm.scan_interaction(G)
+    assert_equal(pv.shape, (0,))
@@ -1,17 +1,21 @@
 import pytest
-from celregmap._math import (
+from cellregmap._math import (
+    BlockQS,
     P_matrix,
+    PMat,
     QSCov,
+    ScoreStatistic,
+    gram_qs,
     qmin,
     rsolve,
     score_statistic,
     score_statistic_distr_weights,
     score_statistic_liu_params,
 )
-from numpy import array, eye
+from numpy import array, concatenate, eye, sqrt
 from numpy.random import RandomState
 from numpy.testing import assert_allclose
-from numpy_sugar.linalg import economic_qs
+from numpy_sugar.linalg import economic_qs, economic_qs_linear
 
 
 @pytest.fixture
@@ -65,19 +69,19 @@ def test_P_matrix(data):
 
 def test_score_statistic(data):
     q = score_statistic(data["y"], data["W"], data["K"], data["dK"])
-    assert_allclose(q, 0.49961017073389324)
+    assert_allclose(q, 0.28956873514565284)
 
 
 def test_score_statistic_distr_weights(data):
     weights = score_statistic_distr_weights(data["W"], data["K"], data["dK"])
-    assert_allclose(weights, array([4.55266277e-09, 3.46249449e-01]), atol=1e-7)
+    assert_allclose(weights, array([3.46249449e-01]), atol=1e-7)
 
 
 def test_score_statistic_liu_params(data):
     q = score_statistic(data["y"], data["W"], data["K"], data["dK"])
     weights = score_statistic_distr_weights(data["W"], data["K"], data["dK"])
     params = score_statistic_liu_params(q, weights)
-    assert_allclose(params["pv"], 0.22966744652848403)
+    assert_allclose(params["pv"], 0.36045685853248943)
     assert_allclose(params["mu_q"], 0.34624945394475326)
     assert_allclose(params["sigma_q"], 0.48967066729451103)
     assert_allclose(params["dof_x"], 1.0)
@@ -89,3 +93,51 @@ def test_qmin(data):
     params += [{"pv": 0.65, "mu_q": 0.695, "sigma_q": 0.1, "dof_x": 0.7}]
     expected = [0.5506645025120773, 0.7157125486956082]
     assert_allclose(qmin(params), expected)
+
+
+def test_BlockQS():
+    random = RandomState(0)
+    A = random.randn(10, 2)
+    B = random.randn(10, 4)
+    bqs = BlockQS(A, B)
+
+    for rho in [0.0, 0.3, 1.0]:
+        a = sqrt(rho)
+        b = sqrt(1 - rho)
+        QS = bqs(a, b)
+        K = concatenate((a * A, b * B), axis=1)
+        K = K @ K.T
+        assert_allclose(QS[0][0] @ (QS[1][:, None] * QS[0][0].T), K, atol=1e-10)
+        QS_ = economic_qs_linear(concatenate((a * A, b * B), axis=1), return_q1=False)
+        S = QS_[1][QS_[1] > 1e-8]
+        assert_allclose(sorted(QS[1]), sorted(S))
+
+
+def test_gram_qs():
+    random = RandomState(0)
+    for shape in [(10, 3), (4, 6)]:
+        G = random.randn(*shape)
+        (Q0,), S0 = gram_qs(G)
+        assert_allclose(Q0 @ (S0[:, None] * Q0.T), G @ G.T, atol=1e-10)
+        assert_allclose(Q0.T @ Q0, eye(len(S0)), atol=1e-10)
+        QS = economic_qs_linear(G, return_q1=False)
+        assert_allclose(sorted(S0), sorted(QS[1][QS[1] > 1e-8]))
+
+
+def test_ScoreStatistic(data):
+    random = RandomState(1)
+    n_samples = data["y"].shape[0]
+    K0 = data["dK"]
+    QS = economic_qs(K0)
+    qscov = QSCov(QS[0][0], QS[1], 0.2, 1.0)
+    P = PMat(qscov, data["W"])
+    sqrt_dK = random.randn(n_samples, 2)
+
+    ss = ScoreStatistic(P, qscov, sqrt_dK)
+    Q, matrix = ss.statistic_and_matrix(data["y"])
+    assert_allclose(Q, ss.statistic(data["y"]))
+    assert_allclose(matrix, ss.matrix_for_dist_weights())
+
+    Pd = P_matrix(data["W"], data["K"])
+    y = data["y"]
+    assert_allclose(Q, y @ Pd @ sqrt_dK @ sqrt_dK.T @ Pd @ y / 2)
@@ -1,13 +1,17 @@
 import pytest
-from numpy import logical_and, ones, tile, zeros
+from numpy import eye, int8, logical_and, ones, repeat, sqrt, tile, zeros
 from numpy.linalg import matrix_rank
-from numpy.random import RandomState
+from numpy.random import RandomState, default_rng
 from numpy.testing import assert_, assert_allclose, assert_equal
 
 from cellregmap._simulate import (
+    SimulationContext,
+    _repeat_normalize,
     column_normalize,
     create_environment_matrix,
+    create_environment_vector,
     create_variances,
+    jitter,
     sample_covariance_matrix,
     sample_genotype,
     sample_gxe_effects,
@@ -15,6 +19,7 @@ from cellregmap._simulate import (
     sample_noise_effects,
     sample_persistent_effsizes,
     sample_phenotype,
+    sample_phenotype_gxe,
 )
 
 
@@ -37,12 +42,23 @@ def test_sample_genotype():
     mafs = sample_maf(n_snps, maf_min, maf_max, random)
     G = sample_genotype(n_samples, mafs, random)
     assert_(G.shape == (n_samples, n_snps))
+    assert_(G.dtype == int8)
 
     A = set(list(G.ravel()))
     B = set([0.0, 1.0, 2.0])
     assert_(A - B == set())
 
 
+def test_sample_genotype_hardy_weinberg():
+    random = RandomState(0)
+    n_samples = 20000
+    mafs = sample_maf(5, 0.1, 0.4, random)
+    G = sample_genotype(n_samples, mafs, random)
+
+    assert_allclose(G.mean(0) / 2, mafs, atol=0.01)
+    assert_allclose((G == 1).mean(0), 2 * mafs * (1 - mafs), atol=0.02)
+
+
 def test_column_normalize():
     random = RandomState(0)
     n_samples = 10
@@ -56,6 +72,18 @@ def test_column_normalize():
     assert_allclose(G.std(0), ones(n_snps))
 
 
+def test_repeat_normalize():
+    random = RandomState(0)
+    mafs = sample_maf(30, 0.2, 0.3, random)
+    G = sample_genotype(10, mafs, random)
+
+    for n_cells in [3, random.randint(1, 5, size=10)]:
+        Gr = _repeat_normalize(G, n_cells)
+        assert_allclose(Gr.mean(0), zeros(30), atol=1e-7)
+        assert_allclose(Gr.std(0), ones(30))
+        assert_allclose(Gr, column_normalize(repeat(G, n_cells, axis=0)))
+
+
 def test_sample_covariance_matrix():
     random = RandomState(0)
     n_samples = 5
@@ -71,6 +99,64 @@ def test_sample_covariance_matrix():
     assert_(matrix_rank(K) == K.shape[0])
 
 
+def test_create_environment_vector():
+    n_samples = 6
+    for groups in [[], [[0, 1]], [[0, 1], [4]], [[0, 1], [4], [2, 3]]]:
+        E = create_environment_vector(n_samples, groups, default_rng(0))
+        values = default_rng(0).choice([-1, 1], 2, False)
+        expected = zeros((n_samples, 1))
+        for value, group in zip(values, groups):
+            expected[group, 0] = value
+        assert_equal(E, expected)
+
+
+def test_sample_covariance_matrix_factor():
+    groups = [[0, 1, 2], [3], [4, 5]]
+    L, K = sample_covariance_matrix(6, groups)
+    assert_(L.shape == (6, 3))
+    assert_(K.shape == (6, 6))
+    assert_allclose(K.diagonal().mean(), 1.0 + 1e-8)
+    assert_allclose(L @ L.T, K, atol=1e-7)
+    assert_(matrix_rank(K) == K.shape[0])
+
+
+def test_sample_phenotype_gxe_shapes():
+    n_individuals = 30
+    n_cells = 3
+    n_snps = 10
+    n_env_groups = 5
+    n_samples = n_individuals * n_cells
+    s = sample_phenotype_gxe(
+        offset=0.3,
+        n_individuals=n_individuals,
+        n_snps=n_snps,
+        n_cells=n_cells,
+        n_env_groups=n_env_groups,
+        maf_min=0.1,
+        maf_max=0.4,
+        g_causals=[0],
+        gxe_causals=[1, 2],
+        variances=create_variances(0.5, 0.4),
+        random=default_rng(0),
+    )
+    assert_(s.G.shape == (n_samples, n_snps))
+    assert_(s.E.shape == (n_samples, n_env_groups))
+    assert_(s.Lk.shape == (n_samples, n_individuals))
+    assert_(s.K.shape == (n_samples, n_samples))
+    assert_allclose(s.Lk @ s.Lk.T, s.K, atol=1e-7)
+    assert_(len(s.Ls) == n_env_groups)
+    for L in s.Ls:
+        assert_(L.shape == (n_samples, n_individuals))
+    for y in [s.y, s.y_g, s.y_gxe, s.y_k, s.y_e, s.y_n]:
+        assert_(y.shape == (n_samples,))
+
+
+def test_jitter():
+    K = ones((3, 3))
+    jitter(K)
+    assert_allclose(K, ones((3, 3)) + 1e-8 * eye(3), rtol=0, atol=1e-15)
+
+
 def test_variances():
     r0 = 0.1
     v0 = 0.5
@@ -126,6 +212,28 @@ def test_sample_gxe_effects():
     assert_allclose(y2.var(), variance)
 
 
+def test_sample_gxe_effects_stream():
+    random = RandomState(0)
+    G = random.randn(20, 6)
+    E = random.randn(20, 3)
+    causal_indices = [1, 4]
+    variance = 0.5
+
+    y2 = sample_gxe_effects(G, E, causal_indices, variance, RandomState(1))
+
+    # one causal SNP at a time, drawing from the same stream
+    random = RandomState(1)
+    vi = variance / len(causal_indices)
+    expected = zeros(20)
+    for causal in causal_indices:
+        alpha = sqrt(vi) * random.normal(size=3)
+        alpha = (alpha - alpha.mean()) / alpha.std() * sqrt(sqrt(vi))
+        expected += G[:, causal] * (E @ alpha)
+    expected = (expected - expected.mean()) / expected.std() * sqrt(variance)
+
+    assert_allclose(y2, expected)
+
+
 # TODO: put it back
 # def test_sample_environment_effects():
 #     random = RandomState(0)
@@ -215,3 +323,34 @@ def test_sample_phenotype():
 
     assert_(s.E.shape[0] == n_samples * n_rep)
     assert_(s.E.shape[1] == n_env)
+
+
+def test_simulation_context():
+    from numpy import corrcoef
+
+    random = RandomState(0)
+    context = SimulationContext(
+        n_individuals=20,
+        n_snps=30,
+        n_cells=5,
+        n_env=3,
+        n_env_groups=2,
+        maf_min=0.1,
+        maf_max=0.4,
+        random=random,
+    )
+    for r0 in [0.1, 0.6]:
+        v = create_variances(r0, 0.5)
+        s = context.draw(0.3, [3, 4], [4, 5], v, random)
+        assert_(s.G is context.G and s.E is context.E)
+        assert_allclose(s.y, 0.3 + s.y_g + s.y_gxe + s.y_k + s.y_e + s.y_n)
+        assert_allclose(s.y_gxe.var(), v.gxe)
+        assert_(s.y.shape == (100,))
+
+    v = create_variances(0.1, 0.5)
+    sims = context.draw_many(3, 0.3, [3, 4], [4, 5], v, RandomState(1))
+    sims_threads = context.draw_many(3, 0.3, [3, 4], [4, 5], v, RandomState(1), 2)
+    assert_(len(sims) == 3)
+    assert_(abs(corrcoef(sims[0].y_n, sims[1].y_n)[0, 1]) < 0.5)
+    for s, st in zip(sims, sims_threads):
+        assert_allclose(s.y, st.y)